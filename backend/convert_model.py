@@ -0,0 +1,329 @@
+"""
+Build-time conversion of the Keras model into accelerated inference artifacts.
+
+Run once (e.g. in CI or on the deployment host) and point MODEL_PATH at the
+produced file; main.py picks the matching runtime from its extension.
+
+Examples:
+    python convert_model.py tensorrt --precision fp16
+    python convert_model.py tensorrt --precision int8 --calib-dir ./calibration_images
+    python convert_model.py tflite --precision int8 --calib-dir ./calibration_images
+    python convert_model.py tflite --precision fp16
+    python convert_model.py onnx --quantize
+    python convert_model.py uint8
+"""
+import argparse
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from main import IMAGE_SIZE, MODEL_PATH, SCRIPT_DIR, preprocess_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+CALIBRATION_IMAGES = 100
+MAX_BATCH_SIZE = 8
+
+
+def load_keras_model(path: str = MODEL_PATH) -> tf.keras.Model:
+    """Load the source Keras model for inference-only conversion."""
+    return tf.keras.models.load_model(path, compile=False)
+
+
+def export_onnx(model: tf.keras.Model, onnx_path: str, opset: int = 17) -> str:
+    """
+    Export a Keras model to ONNX with a dynamic batch dimension.
+
+    Args:
+        model: Loaded Keras model
+        onnx_path: Destination path for the .onnx file
+        opset: ONNX opset version
+
+    Returns:
+        Name of the ONNX graph input tensor
+    """
+    import tf2onnx
+
+    height, width = IMAGE_SIZE
+    spec = tf.TensorSpec((None, height, width, 3), model.inputs[0].dtype, name="input")
+    model_proto, _ = tf2onnx.convert.from_keras(
+        model, input_signature=[spec], opset=opset, output_path=onnx_path
+    )
+    print(f"✅ Exported ONNX model to {onnx_path}")
+    return model_proto.graph.input[0].name
+
+
+def bake_rescaling(model: tf.keras.Model, output_path: str) -> tf.keras.Model:
+    """
+    Wrap a model so it takes raw uint8 pixels and rescales them in-graph.
+
+    The API then ships uint8 batches (a quarter of the float32 size) and the
+    /255 runs as part of the model, where it fuses into the first layer.
+
+    Args:
+        model: Loaded Keras model expecting float32 input in [0, 1]
+        output_path: Destination path for the .keras file
+
+    Returns:
+        The wrapped uint8-input model
+    """
+    inputs = tf.keras.Input(shape=model.input_shape[1:], dtype="uint8", name="image")
+    x = tf.keras.layers.Rescaling(1.0 / 255)(inputs)
+    wrapped = tf.keras.Model(inputs, model(x), name=f"{model.name}_uint8")
+    wrapped.save(output_path)
+    print(f"✅ Saved uint8-input model to {output_path}")
+    return wrapped
+
+
+def load_calibration_images(calib_dir: str, limit: int = CALIBRATION_IMAGES) -> np.ndarray:
+    """
+    Load and preprocess sample images exactly as the API does at runtime.
+
+    Args:
+        calib_dir: Directory containing representative training images
+        limit: Maximum number of images to use
+
+    Returns:
+        Float32 array of shape (N, H, W, 3)
+    """
+    names = sorted(
+        name for name in os.listdir(calib_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )[:limit]
+    if not names:
+        raise ValueError(f"No calibration images found in {calib_dir}")
+
+    images = []
+    for name in names:
+        with open(os.path.join(calib_dir, name), "rb") as f:
+            images.append(preprocess_image(f.read())[0])
+    print(f"📸 Loaded {len(images)} calibration images from {calib_dir}")
+    return np.stack(images).astype(np.float32)
+
+
+def _make_entropy_calibrator(images: np.ndarray, cache_path: str):
+    """Create a TensorRT INT8 entropy calibrator that feeds one image per batch."""
+    import pycuda.driver as cuda
+    import tensorrt as trt
+
+    class EntropyCalibrator(trt.IInt8EntropyCalibrator2):
+        def __init__(self):
+            super().__init__()
+            self.index = 0
+            self.device_input = cuda.mem_alloc(images[0].nbytes)
+
+        def get_batch_size(self):
+            return 1
+
+        def get_batch(self, names):
+            if self.index >= len(images):
+                return None
+            cuda.memcpy_htod(self.device_input, np.ascontiguousarray(images[self.index:self.index + 1]))
+            self.index += 1
+            return [int(self.device_input)]
+
+        def read_calibration_cache(self):
+            if os.path.exists(cache_path):
+                with open(cache_path, "rb") as f:
+                    return f.read()
+            return None
+
+        def write_calibration_cache(self, cache):
+            with open(cache_path, "wb") as f:
+                f.write(cache)
+
+    return EntropyCalibrator()
+
+
+def build_tensorrt_engine(
+    onnx_path: str,
+    engine_path: str,
+    input_name: str,
+    precision: str = "fp16",
+    calib_images: np.ndarray | None = None,
+    max_batch_size: int = MAX_BATCH_SIZE,
+    workspace_mb: int = 2048,
+) -> None:
+    """
+    Build and serialize a TensorRT engine from an ONNX model.
+
+    Equivalent to ``trtexec --onnx=... --fp16 --saveEngine=...`` with a
+    dynamic-batch optimization profile; INT8 additionally runs entropy
+    calibration over ``calib_images`` (FP16 stays enabled for layers without
+    INT8 kernels).
+
+    Args:
+        onnx_path: Source ONNX model
+        engine_path: Destination path for the serialized engine
+        input_name: Name of the ONNX graph input
+        precision: "fp16" or "int8"
+        calib_images: Preprocessed images, required for INT8
+        max_batch_size: Largest batch the engine must accept
+        workspace_mb: Builder workspace memory limit in MB
+    """
+    import pycuda.autoinit  # noqa: F401 - creates the CUDA context for calibration
+    import tensorrt as trt
+
+    logger = trt.Logger(trt.Logger.WARNING)
+    builder = trt.Builder(logger)
+    network = builder.create_network(0)
+    parser = trt.OnnxParser(network, logger)
+    with open(onnx_path, "rb") as f:
+        if not parser.parse(f.read()):
+            errors = [str(parser.get_error(i)) for i in range(parser.num_errors)]
+            raise RuntimeError(f"Failed to parse {onnx_path}: {errors}")
+
+    config = builder.create_builder_config()
+    config.set_memory_pool_limit(trt.MemoryPoolType.WORKSPACE, workspace_mb << 20)
+    config.set_flag(trt.BuilderFlag.FP16)
+
+    height, width = IMAGE_SIZE
+    profile = builder.create_optimization_profile()
+    profile.set_shape(
+        input_name,
+        (1, height, width, 3),
+        (1, height, width, 3),
+        (max_batch_size, height, width, 3),
+    )
+    config.add_optimization_profile(profile)
+
+    if precision == "int8":
+        if calib_images is None:
+            raise ValueError("INT8 precision requires calibration images")
+        config.set_flag(trt.BuilderFlag.INT8)
+        calib_profile = builder.create_optimization_profile()
+        calib_profile.set_shape(input_name, *[(1, height, width, 3)] * 3)
+        config.set_calibration_profile(calib_profile)
+        config.int8_calibrator = _make_entropy_calibrator(
+            calib_images, os.path.splitext(engine_path)[0] + ".calib"
+        )
+
+    print(f"⏳ Building {precision.upper()} TensorRT engine (this may take several minutes)...")
+    serialized = builder.build_serialized_network(network, config)
+    if serialized is None:
+        raise RuntimeError("TensorRT engine build failed")
+    with open(engine_path, "wb") as f:
+        f.write(serialized)
+    print(f"✅ Saved TensorRT engine to {engine_path}")
+
+
+def convert_tflite(
+    model: tf.keras.Model,
+    tflite_path: str,
+    precision: str = "int8",
+    calib_images: np.ndarray | None = None,
+) -> None:
+    """
+    Convert a Keras model to a TFLite flatbuffer for CPU inference.
+
+    INT8 applies full-integer post-training quantization calibrated on
+    ``calib_images`` with a uint8 input; FP16 halves the weights while keeping
+    float compute for accuracy-sensitive deployments.
+
+    Args:
+        model: Loaded Keras model
+        tflite_path: Destination path for the .tflite file
+        precision: "int8", "fp16" or "fp32"
+        calib_images: Preprocessed images, required for INT8
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if precision == "int8":
+        if calib_images is None:
+            raise ValueError("INT8 precision requires calibration images")
+
+        def representative_dataset():
+            for image in calib_images:
+                yield [image[None, ...]]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.uint8
+    elif precision == "fp16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+
+    print(f"⏳ Converting to {precision.upper()} TFLite...")
+    tflite_model = converter.convert()
+    with open(tflite_path, "wb") as f:
+        f.write(tflite_model)
+    print(f"✅ Saved TFLite model to {tflite_path} ({len(tflite_model) / (1024*1024):.2f} MB)")
+
+
+def quantize_onnx(onnx_path: str, quantized_path: str) -> None:
+    """
+    Apply dynamic-range INT8 quantization to an ONNX model.
+
+    Weights are stored as INT8 and activations are quantized on the fly, so
+    no calibration data is needed.
+
+    Args:
+        onnx_path: Source float ONNX model
+        quantized_path: Destination path for the quantized model
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+    print(f"✅ Saved dynamic INT8 ONNX model to {quantized_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--model", default=MODEL_PATH, help="Source .keras model")
+    subparsers = parser.add_subparsers(dest="target", required=True)
+
+    trt_parser = subparsers.add_parser("tensorrt", help="Build a TensorRT engine via ONNX")
+    trt_parser.add_argument("--precision", choices=["fp16", "int8"], default="fp16")
+    trt_parser.add_argument("--calib-dir", help="Sample images for INT8 calibration")
+    trt_parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE)
+    trt_parser.add_argument("--workspace-mb", type=int, default=2048)
+    trt_parser.add_argument("--onnx", default=os.path.join(SCRIPT_DIR, "model.onnx"))
+    trt_parser.add_argument("--output", help="Engine path (default: model_<precision>.engine)")
+
+    tflite_parser = subparsers.add_parser("tflite", help="Convert to a TFLite flatbuffer for CPU")
+    tflite_parser.add_argument("--precision", choices=["int8", "fp16", "fp32"], default="int8")
+    tflite_parser.add_argument("--calib-dir", help="Representative images for INT8 quantization")
+    tflite_parser.add_argument("--output", help="TFLite path (default: model_<precision>.tflite)")
+
+    onnx_parser = subparsers.add_parser("onnx", help="Export to ONNX for ONNX Runtime")
+    onnx_parser.add_argument("--opset", type=int, default=17)
+    onnx_parser.add_argument("--quantize", action="store_true", help="Also write a dynamic INT8 model")
+    onnx_parser.add_argument("--output", default=os.path.join(SCRIPT_DIR, "model.onnx"))
+
+    uint8_parser = subparsers.add_parser("uint8", help="Bake the /255 rescaling into a uint8-input Keras model")
+    uint8_parser.add_argument("--output", default=os.path.join(SCRIPT_DIR, "model_u8.keras"))
+
+    args = parser.parse_args()
+    if getattr(args, "precision", None) == "int8" and not args.calib_dir:
+        parser.error("--calib-dir is required for --precision int8")
+    model = load_keras_model(args.model)
+    calib_images = (
+        load_calibration_images(args.calib_dir)
+        if getattr(args, "precision", None) == "int8" else None
+    )
+
+    if args.target == "tensorrt":
+        output = args.output or os.path.join(SCRIPT_DIR, f"model_{args.precision}.engine")
+        input_name = export_onnx(model, args.onnx)
+        build_tensorrt_engine(
+            args.onnx,
+            output,
+            input_name,
+            precision=args.precision,
+            calib_images=calib_images,
+            max_batch_size=args.max_batch_size,
+            workspace_mb=args.workspace_mb,
+        )
+    elif args.target == "tflite":
+        output = args.output or os.path.join(SCRIPT_DIR, f"model_{args.precision}.tflite")
+        convert_tflite(model, output, precision=args.precision, calib_images=calib_images)
+    elif args.target == "onnx":
+        export_onnx(model, args.output, opset=args.opset)
+        if args.quantize:
+            quantize_onnx(args.output, os.path.splitext(args.output)[0] + ".int8.onnx")
+    elif args.target == "uint8":
+        bake_rescaling(model, args.output)
+
+
+if __name__ == "__main__":
+    main()
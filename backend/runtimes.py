@@ -0,0 +1,232 @@
+"""
+Alternative inference runtimes for the Pest Classification API.
+
+Each runtime wraps a converted model artifact (see convert_model.py) and
+exposes the small subset of the Keras model interface that main.py relies on:
+``input_shape``, ``output_shape``, ``input_dtype`` (float32, or uint8 for
+models that rescale pixels in-graph) and ``predict(batch, verbose=0)``.
+Runtime packages are imported lazily so only the selected one is required.
+"""
+import os
+import threading
+
+import numpy as np
+
+
+class TensorRTModel:
+    """
+    Run a serialized TensorRT engine built from the Keras model.
+
+    The engine is deserialized once and device buffers are allocated for the
+    largest batch the engine accepts, so each prediction only copies the input
+    to the GPU, enqueues the engine and copies the probabilities back.
+    """
+
+    def __init__(self, engine_path: str):
+        import pycuda.driver as cuda
+        import tensorrt as trt
+
+        self._cuda = cuda
+
+        # Own an explicit CUDA context: predictions run on threadpool workers,
+        # which must push it before touching device memory.
+        cuda.init()
+        self._ctx = cuda.Device(0).make_context()
+        try:
+            logger = trt.Logger(trt.Logger.WARNING)
+            with open(engine_path, "rb") as f:
+                self._engine = trt.Runtime(logger).deserialize_cuda_engine(f.read())
+            if self._engine is None:
+                raise RuntimeError(f"Failed to deserialize TensorRT engine at {engine_path}")
+            self._context = self._engine.create_execution_context()
+            self._stream = cuda.Stream()
+
+            self._input_name = None
+            self._output_name = None
+            for i in range(self._engine.num_io_tensors):
+                name = self._engine.get_tensor_name(i)
+                if self._engine.get_tensor_mode(name) == trt.TensorIOMode.INPUT:
+                    self._input_name = name
+                else:
+                    self._output_name = name
+
+            # Dynamic-batch engines report -1 for the batch dimension; size the
+            # persistent buffers for the largest batch of optimization profile 0.
+            in_shape = tuple(self._engine.get_tensor_shape(self._input_name))
+            if in_shape[0] == -1:
+                max_shape = self._engine.get_tensor_profile_shape(self._input_name, 0)[2]
+                self.max_batch_size = int(max_shape[0])
+            else:
+                self.max_batch_size = int(in_shape[0])
+            out_shape = tuple(self._engine.get_tensor_shape(self._output_name))
+
+            self.input_shape = (None,) + tuple(int(d) for d in in_shape[1:])
+            self.output_shape = (None,) + tuple(int(d) for d in out_shape[1:])
+            self.input_dtype = np.dtype(trt.nptype(self._engine.get_tensor_dtype(self._input_name)))
+
+            self._host_in = cuda.pagelocked_empty(
+                (self.max_batch_size,) + self.input_shape[1:], dtype=self.input_dtype
+            )
+            self._host_out = cuda.pagelocked_empty(
+                (self.max_batch_size,) + self.output_shape[1:], dtype=np.float32
+            )
+            self._d_in = cuda.mem_alloc(self._host_in.nbytes)
+            self._d_out = cuda.mem_alloc(self._host_out.nbytes)
+            self._context.set_tensor_address(self._input_name, int(self._d_in))
+            self._context.set_tensor_address(self._output_name, int(self._d_out))
+            # Buffers and execution context are shared, so runs must not overlap.
+            self._lock = threading.Lock()
+        finally:
+            self._ctx.pop()
+
+    def predict(self, batch: np.ndarray, verbose: int = 0) -> np.ndarray:
+        """
+        Run the engine on a preprocessed batch.
+
+        Args:
+            batch: Array of shape (N, H, W, C) in input_dtype, with N <= max_batch_size
+            verbose: Ignored; accepted for parity with keras.Model.predict
+
+        Returns:
+            Model predictions as numpy array of shape (N, num_classes)
+        """
+        cuda = self._cuda
+        n = batch.shape[0]
+        if n > self.max_batch_size:
+            raise ValueError(f"Batch of {n} exceeds engine maximum of {self.max_batch_size}")
+
+        with self._lock:
+            self._ctx.push()
+            try:
+                self._host_in[:n] = batch
+                self._context.set_input_shape(self._input_name, batch.shape)
+                cuda.memcpy_htod_async(self._d_in, self._host_in[:n], self._stream)
+                self._context.execute_async_v3(self._stream.handle)
+                cuda.memcpy_dtoh_async(self._host_out, self._d_out, self._stream)
+                self._stream.synchronize()
+            finally:
+                self._ctx.pop()
+            return self._host_out[:n].copy()
+
+
+def _tflite_interpreter_class():
+    """
+    Return the lightest available TFLite interpreter: LiteRT
+    (ai-edge-litert), then the legacy tflite-runtime, then full TensorFlow.
+    """
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    """
+    Run a TFLite flatbuffer produced by convert_model.py on CPU.
+
+    Quantized models are fed through their input quantization parameters and
+    their outputs dequantized. Models whose uint8 input is the raw pixels
+    (unquantized, or quantized with scale 1/255 and zero point 0) report
+    ``input_dtype`` uint8 and take the pixels as-is.
+    """
+
+    def __init__(self, model_path: str, num_threads: int | None = None):
+        Interpreter = _tflite_interpreter_class()
+        self._interpreter = Interpreter(
+            model_path=model_path, num_threads=num_threads or os.cpu_count()
+        )
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = int(self._input["shape"][0])
+
+        self.input_shape = (None,) + tuple(int(d) for d in self._input["shape"][1:])
+        self.output_shape = (None,) + tuple(int(d) for d in self._output["shape"][1:])
+        scale, zero_point = self._input["quantization"]
+        raw_pixels = scale == 0 or (abs(scale * 255 - 1) < 1e-3 and zero_point == 0)
+        if self._input["dtype"] == np.uint8 and raw_pixels:
+            self.input_dtype = np.dtype(np.uint8)
+        else:
+            self.input_dtype = np.dtype(np.float32)
+        # The interpreter owns its tensors, so invocations must not overlap.
+        self._lock = threading.Lock()
+
+    def predict(self, batch: np.ndarray, verbose: int = 0) -> np.ndarray:
+        """
+        Run the interpreter on a preprocessed batch.
+
+        Args:
+            batch: Array of shape (N, H, W, C) in input_dtype
+            verbose: Ignored; accepted for parity with keras.Model.predict
+
+        Returns:
+            Model predictions as numpy array of shape (N, num_classes)
+        """
+        with self._lock:
+            interp = self._interpreter
+            if batch.shape[0] != self._batch_size:
+                interp.resize_tensor_input(self._input["index"], batch.shape)
+                interp.allocate_tensors()
+                self._batch_size = batch.shape[0]
+
+            input_dtype = self._input["dtype"]
+            if input_dtype != np.float32 and batch.dtype != input_dtype:
+                scale, zero_point = self._input["quantization"]
+                info = np.iinfo(input_dtype)
+                batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max)
+            interp.set_tensor(self._input["index"], batch.astype(input_dtype, copy=False))
+            interp.invoke()
+            output = interp.get_tensor(self._output["index"])
+
+        if output.dtype != np.float32:
+            scale, zero_point = self._output["quantization"]
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+class OnnxModel:
+    """
+    Run an ONNX export of the Keras model with ONNX Runtime.
+
+    The session applies ORT's full graph optimizations (constant folding,
+    conv+bn+activation fusion, memory planning) once at load time and uses
+    CUDA when available, falling back to CPU.
+    """
+
+    def __init__(self, model_path: str, num_threads: int | None = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads or os.cpu_count()
+        available = ort.get_available_providers()
+        providers = [
+            p for p in ("CUDAExecutionProvider", "CPUExecutionProvider") if p in available
+        ]
+        self._session = ort.InferenceSession(model_path, sess_options=options, providers=providers)
+
+        model_input = self._session.get_inputs()[0]
+        model_output = self._session.get_outputs()[0]
+        self._input_name = model_input.name
+        self.input_dtype = np.dtype(np.uint8 if model_input.type == "tensor(uint8)" else np.float32)
+        # Dynamic dimensions are reported as names or None; expose them as None
+        self.input_shape = (None,) + tuple(d if isinstance(d, int) else None for d in model_input.shape[1:])
+        self.output_shape = (None,) + tuple(d if isinstance(d, int) else None for d in model_output.shape[1:])
+
+    def predict(self, batch: np.ndarray, verbose: int = 0) -> np.ndarray:
+        """
+        Run the session on a preprocessed batch.
+
+        Args:
+            batch: Array of shape (N, H, W, C) in input_dtype
+            verbose: Ignored; accepted for parity with keras.Model.predict
+
+        Returns:
+            Model predictions as numpy array of shape (N, num_classes)
+        """
+        return self._session.run(None, {self._input_name: batch})[0]
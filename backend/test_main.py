@@ -4,6 +4,7 @@ Run with: pytest test_main.py
 """
 import os
 import io
+import threading
 from PIL import Image
 import numpy as np
 import pytest
@@ -43,6 +44,80 @@ def test_predict_endpoint_invalid_file_type():
     assert "Invalid file type" in response.json()["detail"]
 
 
+def test_predict_endpoint_file_too_large(monkeypatch):
+    """Test prediction endpoint rejects uploads over the size limit."""
+    import main
+
+    monkeypatch.setattr(main, "MAX_FILE_SIZE", 1024)
+    files = {"file": ("big.jpg", b"\xff" * 4096, "image/jpeg")}
+    response = client.post("/predict", files=files)
+
+    if response.status_code == 503:
+        pytest.skip("Model not available in test environment")
+
+    assert response.status_code == 413
+    assert "File too large" in response.json()["detail"]
+
+
+def test_predict_endpoint_content_length_too_large(monkeypatch):
+    """Test oversized requests are refused from Content-Length before form parsing."""
+    import main
+
+    monkeypatch.setattr(main, "MAX_FILE_SIZE", 1024)
+    # The endpoint would answer 503 if it ran; the middleware answers first
+    monkeypatch.setattr(main, "model", None)
+    monkeypatch.setattr(main, "load_model_safe", lambda: False)
+
+    files = {"file": ("big.jpg", b"\xff" * (64 * 1024), "image/jpeg")}
+    response = client.post("/predict", files=files, headers={"Origin": "http://localhost:5173"})
+
+    assert response.status_code == 413
+    assert "File too large" in response.json()["detail"]
+    assert response.headers["access-control-allow-origin"] == "http://localhost:5173"
+
+
+def test_read_upload_aborts_over_limit_without_size():
+    """Test chunked reads stop with 413 once a body of unknown size exceeds the limit."""
+    import asyncio
+    from fastapi import HTTPException, UploadFile
+    from main import UPLOAD_CHUNK_SIZE, read_upload
+
+    limit = 100 * 1024
+    body = io.BytesIO(b"\xff" * (1024 * 1024))
+    upload = UploadFile(file=body, filename="big.jpg", size=None)
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(read_upload(upload, limit))
+
+    assert exc_info.value.status_code == 413
+    # Reading stopped at the first chunk past the limit, not at the end
+    assert body.tell() <= limit + UPLOAD_CHUNK_SIZE
+
+    small = UploadFile(file=io.BytesIO(b"abc" * 100), filename="small.jpg", size=None)
+    assert asyncio.run(read_upload(small, limit)) == bytearray(b"abc" * 100)
+
+
+@pytest.mark.filterwarnings("ignore::PIL.Image.DecompressionBombWarning")
+def test_predict_endpoint_decompression_bomb(monkeypatch):
+    """Test the pixel limit matches Pillow: rejected above 2x, accepted up to it."""
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 100 * 100)
+
+    # 2.4x and 6x the limit are rejected; 1.5x only warns in Pillow and is served
+    for size, expected_status in (((200, 120), 400), ((300, 200), 400), ((150, 100), 200)):
+        for fmt, content_type in (("PNG", "image/png"), ("JPEG", "image/jpeg"), ("BMP", "image/bmp")):
+            img_bytes = io.BytesIO()
+            Image.new("RGB", size).save(img_bytes, format=fmt)
+            files = {"file": (f"image.{fmt.lower()}", img_bytes.getvalue(), content_type)}
+            response = client.post("/predict", files=files)
+
+            if response.status_code == 503:
+                pytest.skip("Model not available in test environment")
+
+            assert response.status_code == expected_status, (size, fmt)
+            if expected_status == 400:
+                assert "exceeds" in response.json()["detail"]
+
+
 def test_predict_endpoint_valid_image():
     """Test prediction endpoint with valid image."""
     img_bytes = create_test_image()
@@ -72,6 +147,207 @@ def test_predict_endpoint_valid_image():
     assert abs(sum(data["probabilities"]) - 1.0) < 0.01  # Sum should be ~1
 
 
+def test_predict_endpoint_duplicate_upload_cached():
+    """Test identical uploads are served from the prediction cache."""
+    import main
+
+    main._prediction_cache.clear()
+    payload = create_test_image(color=(10, 200, 30)).getvalue()
+    responses = [
+        client.post("/predict", files={"file": ("dup.jpg", payload, "image/jpeg")})
+        for _ in range(2)
+    ]
+
+    if responses[0].status_code == 503:
+        pytest.skip("Model not available in test environment")
+
+    assert [r.status_code for r in responses] == [200, 200]
+    assert responses[0].json() == responses[1].json()
+    assert len(main._prediction_cache) == 1
+
+
+def test_predict_endpoint_concurrent_requests_batched(monkeypatch):
+    """Test concurrent predictions through the micro-batching worker."""
+    from concurrent.futures import ThreadPoolExecutor
+    import main
+
+    # Identical uploads would otherwise be answered from the prediction cache
+    main._prediction_cache.clear()
+    monkeypatch.setattr(main, "PREDICTION_CACHE_SIZE", 0)
+    # A generous timeout lets all four requests join one batch even on a
+    # slow machine; the batch still fires as soon as it is full
+    monkeypatch.setattr(main, "BATCH_SIZE", 4)
+    monkeypatch.setattr(main, "BATCH_TIMEOUT_MS", 1000)
+
+    # Record which threads run forward passes (warmup included) and the
+    # number of rows in each batch
+    infer_threads = set()
+    batch_rows = []
+    build_infer = main._build_infer
+
+    def recording_build_infer(loaded_model):
+        infer_fn = build_infer(loaded_model)
+
+        def recording_infer(batch):
+            infer_threads.add(threading.current_thread().name)
+            batch_rows.append(batch.shape[0])
+            return infer_fn(batch)
+
+        return recording_infer
+
+    monkeypatch.setattr(main, "_build_infer", recording_build_infer)
+
+    def post(test_client):
+        files = {"file": ("test.jpg", create_test_image(), "image/jpeg")}
+        return test_client.post("/predict", files=files)
+
+    # Entering the client runs lifespan, which starts the batch worker
+    with TestClient(app) as batching_client:
+        # Drop warmup batches; only request batches count
+        batch_rows.clear()
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            responses = list(pool.map(post, [batching_client] * 4))
+
+    if any(r.status_code == 503 for r in responses):
+        pytest.skip("Model not available in test environment")
+
+    assert all(r.status_code == 200 for r in responses)
+    # Every forward pass ran on the single inference thread
+    assert len(infer_threads) == 1
+    assert infer_threads.pop().startswith("infer")
+    assert main._infer_executor is None
+    # Concurrent requests were coalesced into a shared forward pass
+    assert sum(batch_rows) == 4
+    assert max(batch_rows) > 1
+    results = [r.json() for r in responses]
+    # Identical images must get identical results regardless of batch position
+    assert all(r["index"] == results[0]["index"] for r in results)
+    for r in results:
+        np.testing.assert_allclose(r["probabilities"], results[0]["probabilities"], atol=1e-5)
+
+
+def test_batch_worker_survives_failed_batch(monkeypatch):
+    """Test a batch that can't be stacked fails its requests, not the worker."""
+    import asyncio
+    import main
+
+    monkeypatch.setattr(main, "model", object())
+    monkeypatch.setattr(main, "infer", lambda batch: batch.reshape(len(batch), -1)[:, :2])
+    monkeypatch.setattr(main, "BATCH_SIZE", 2)
+    monkeypatch.setattr(main, "BATCH_TIMEOUT_MS", 1000)
+
+    async def scenario():
+        monkeypatch.setattr(main, "_batch_ready", asyncio.Event())
+        monkeypatch.setattr(main, "_batch_full", asyncio.Event())
+        monkeypatch.setattr(main, "_batch_task", asyncio.create_task(main.batch_worker()))
+        try:
+            # Mismatched shapes make np.concatenate raise for this batch
+            failed = await asyncio.wait_for(
+                asyncio.gather(
+                    main.predict_async(np.zeros((1, 2, 2, 3), np.float32)),
+                    main.predict_async(np.zeros((1, 3, 3, 3), np.float32)),
+                    return_exceptions=True,
+                ),
+                5,
+            )
+            assert all(isinstance(r, ValueError) for r in failed)
+            # The worker is still alive and serves the next request
+            result = await asyncio.wait_for(main.predict_async(np.ones((1, 2, 2, 3), np.float32)), 5)
+            np.testing.assert_array_equal(result, [[1.0, 1.0]])
+        finally:
+            main._batch_task.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_batch_worker_fires_at_engine_max_batch(monkeypatch):
+    """Test a batch full at the engine's maximum runs without waiting out the timeout."""
+    import asyncio
+    import main
+
+    class FixedBatchModel:
+        max_batch_size = 2
+
+    monkeypatch.setattr(main, "model", FixedBatchModel())
+    monkeypatch.setattr(main, "infer", lambda batch: batch.reshape(len(batch), -1)[:, :2])
+    monkeypatch.setattr(main, "BATCH_SIZE", 8)
+    monkeypatch.setattr(main, "BATCH_TIMEOUT_MS", 10_000)
+
+    async def scenario():
+        monkeypatch.setattr(main, "_batch_ready", asyncio.Event())
+        monkeypatch.setattr(main, "_batch_full", asyncio.Event())
+        monkeypatch.setattr(main, "_batch_task", asyncio.create_task(main.batch_worker()))
+        try:
+            first = asyncio.create_task(main.predict_async(np.ones((1, 2, 2, 3), np.float32)))
+            # Let the worker pick up the first request and start waiting for more
+            await asyncio.sleep(0.05)
+            second = main.predict_async(np.ones((1, 2, 2, 3), np.float32))
+            await asyncio.wait_for(asyncio.gather(first, second), 2)
+        finally:
+            main._batch_task.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_warmup_respects_engine_max_batch_size(monkeypatch):
+    """Test warmup never exceeds a fixed-batch engine's maximum."""
+    import main
+
+    class FixedBatchModel:
+        input_shape = (None, *IMAGE_SIZE, 3)
+        input_dtype = np.float32
+        max_batch_size = 2
+
+    seen = []
+
+    def fake_infer(batch):
+        if batch.shape[0] > FixedBatchModel.max_batch_size:
+            raise ValueError("Batch exceeds engine maximum")
+        seen.append(batch.shape[0])
+
+    monkeypatch.setattr(main, "BATCH_SIZE", 8)
+    monkeypatch.setattr(main, "infer_from_bytes", None)
+    monkeypatch.setattr(main, "_is_keras_model", lambda loaded_model: False)
+    main._warmup(FixedBatchModel(), fake_infer)
+
+    assert sorted(set(seen)) == [1, 2]
+
+
+def test_warmup_failure_is_not_a_load_error(monkeypatch):
+    """Test a failing warmup leaves the loaded model serving without a load error."""
+    import main
+
+    if not os.path.exists(main.MODEL_PATH):
+        pytest.skip("Model not available in test environment")
+
+    def failing_warmup(loaded_model, infer_fn):
+        raise RuntimeError("warmup exploded")
+
+    monkeypatch.setattr(main, "_warmup", failing_warmup)
+    with TestClient(app) as lifespan_client:
+        assert main.model is not None
+        assert main.model_load_error is None
+        response = lifespan_client.post(
+            "/predict", files={"file": ("test.jpg", create_test_image(), "image/jpeg")}
+        )
+    assert response.status_code == 200
+
+
+def test_infer_matches_keras_predict():
+    """Test the direct model call path against model.predict."""
+    import main
+    tf = pytest.importorskip("tensorflow")
+
+    if not main.load_model_safe():
+        pytest.skip("Model not available in test environment")
+    if not isinstance(main.model, tf.keras.Model):
+        pytest.skip("Non-Keras runtime loaded")
+
+    batch = np.random.default_rng(0).random((2, *IMAGE_SIZE, 3), dtype=np.float32)
+    expected = main.model.predict(batch, verbose=0)
+    np.testing.assert_allclose(main.infer(batch), expected, atol=1e-5)
+
+
 def test_preprocess_image():
     """Test image preprocessing function."""
     # Create test image
@@ -94,6 +370,171 @@ def test_preprocess_image():
     assert result.dtype == np.float32
 
 
+def test_preprocess_image_uint8_model(monkeypatch):
+    """Test models with in-graph rescaling receive the raw uint8 pixels."""
+    import main
+
+    img_bytes_data = create_test_image().read()
+    monkeypatch.setattr(main, "MODEL_INPUT_DTYPE", np.dtype(np.float32))
+    expected = preprocess_image(img_bytes_data)
+
+    monkeypatch.setattr(main, "MODEL_INPUT_DTYPE", np.dtype(np.uint8))
+    result = preprocess_image(img_bytes_data)
+
+    assert result.shape == (1, 224, 224, 3)
+    assert result.dtype == np.uint8
+    np.testing.assert_allclose(result / 255.0, expected, atol=1e-6)
+
+
+def test_predict_endpoint_gpu_path_corrupt_jpeg(monkeypatch):
+    """Test the in-graph JPEG path returns 400 for undecodable uploads."""
+    import main
+    tf = pytest.importorskip("tensorflow")
+
+    if not main.load_model_safe():
+        pytest.skip("Model not available in test environment")
+    if not isinstance(main.model, tf.keras.Model):
+        pytest.skip("Non-Keras runtime loaded")
+
+    # Pretend a GPU is visible so the raw-JPEG path is built (it runs on CPU)
+    monkeypatch.setattr(main, "GPU_PREPROCESS", True)
+    monkeypatch.setattr(tf.config, "list_physical_devices", lambda device_type=None: ["GPU:0"])
+    # With batching on, JPEGs stay on the batched path
+    monkeypatch.setattr(main, "BATCH_SIZE", 8)
+    assert main._build_infer_from_bytes(main.model) is None
+    monkeypatch.setattr(main, "BATCH_SIZE", 1)
+    monkeypatch.setattr(main, "infer_from_bytes", main._build_infer_from_bytes(main.model))
+    assert main.infer_from_bytes is not None
+
+    truncated = create_test_image().getvalue()[:300]
+    response = client.post("/predict", files={"file": ("bad.jpg", truncated, "image/jpeg")})
+
+    assert response.status_code == 400
+    assert "corrupt JPEG" in response.json()["detail"]
+    assert "DecodeJpeg" not in response.json()["detail"]
+
+
+def test_decode_with_turbojpeg():
+    """Test the libjpeg-turbo scaled decode against a full OpenCV decode."""
+    import cv2
+    import main
+
+    if main._turbojpeg is None:
+        pytest.skip("libjpeg-turbo not available")
+
+    gradient = np.linspace(0, 255, 1600, dtype=np.uint8)
+    pixels = np.dstack([np.tile(gradient, (1200, 1))] * 3)
+    img_bytes = io.BytesIO()
+    Image.fromarray(pixels).save(img_bytes, format="JPEG", quality=95)
+    data = bytearray(img_bytes.getvalue())
+
+    result = main._decode_with_turbojpeg(data, (224, 224))
+    assert result.shape == (224, 224, 3)
+    assert result.dtype == np.uint8
+
+    full = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    expected = cv2.cvtColor(cv2.resize(full, (224, 224), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2RGB)
+    assert np.abs(result.astype(int) - expected).mean() < 2
+
+    # Non-JPEG data is left to the OpenCV/PIL fallbacks
+    assert main._decode_with_turbojpeg(bytearray(b"\x89PNG\r\n\x1a\n"), (224, 224)) is None
+
+
+@pytest.mark.parametrize("variant", ["fp32", "uint8", "int8", "int8_io"])
+def test_tflite_model_matches_keras(tmp_path, variant):
+    """Test TFLiteModel against Keras for float, uint8-input and INT8 conversions."""
+    tf = pytest.importorskip("tensorflow")
+    from convert_model import bake_rescaling, convert_tflite
+    from runtimes import TFLiteModel
+
+    tf.keras.utils.set_random_seed(0)
+    keras_model = tf.keras.Sequential([
+        tf.keras.Input((8, 8, 3)),
+        tf.keras.layers.Conv2D(4, 3, activation="relu"),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(2, activation="softmax"),
+    ])
+    # Pixels in [0, 127] keep the INT8 input scale away from 1/255, so the
+    # wrapper has to quantize float input rather than pass pixels through
+    pixels = np.random.default_rng(0).integers(0, 128, (16, 8, 8, 3), dtype=np.uint8)
+    images = pixels.astype(np.float32) / 255
+
+    source = keras_model
+    if variant == "uint8":
+        source = bake_rescaling(keras_model, str(tmp_path / "model_u8.keras"))
+    tflite_path = str(tmp_path / f"model_{variant}.tflite")
+    if variant == "int8":
+        convert_tflite(source, tflite_path, precision="int8", calib_images=images)
+    elif variant == "int8_io":
+        # Integer output as well, so predictions must be dequantized
+        converter = tf.lite.TFLiteConverter.from_keras_model(source)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([image[None]] for image in images)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.uint8
+        converter.inference_output_type = tf.uint8
+        with open(tflite_path, "wb") as f:
+            f.write(converter.convert())
+    else:
+        convert_tflite(source, tflite_path, precision="fp32")
+
+    tflite_model = TFLiteModel(tflite_path, num_threads=1)
+    expected_dtype = np.uint8 if variant == "uint8" else np.float32
+    assert tflite_model.input_dtype == expected_dtype
+    assert tflite_model.input_shape == (None, 8, 8, 3)
+    assert tflite_model.output_shape == (None, 2)
+
+    batch = pixels if expected_dtype == np.uint8 else images
+    atol = 0.05 if variant.startswith("int8") else 1e-5
+    # 3 -> 1 also exercises resizing the interpreter's input back down
+    for n in (1, 3, 1):
+        result = tflite_model.predict(batch[:n])
+        assert result.shape == (n, 2)
+        assert result.dtype == np.float32
+        np.testing.assert_allclose(result, keras_model.predict(images[:n], verbose=0), atol=atol)
+
+
+def test_available_cpus_respects_cgroup_quota(tmp_path, monkeypatch):
+    """Test the CPU count is capped by cgroup v2 and v1 CPU quotas."""
+    import main
+
+    monkeypatch.setattr(main.os, "sched_getaffinity", lambda pid: set(range(8)), raising=False)
+    v2 = tmp_path / "cpu.max"
+    v1_quota = tmp_path / "cpu.cfs_quota_us"
+    v1_period = tmp_path / "cpu.cfs_period_us"
+    monkeypatch.setattr(main, "_CGROUP_V2_CPU_MAX", str(v2))
+    monkeypatch.setattr(main, "_CGROUP_V1_CPU_QUOTA", str(v1_quota))
+    monkeypatch.setattr(main, "_CGROUP_V1_CPU_PERIOD", str(v1_period))
+
+    # No cgroup files: affinity only
+    assert main._available_cpus() == 8
+
+    # cgroup v1: 1.5 CPUs rounds up to 2; -1 means unlimited
+    v1_quota.write_text("150000\n")
+    v1_period.write_text("100000\n")
+    assert main._available_cpus() == 2
+    v1_quota.write_text("-1\n")
+    assert main._available_cpus() == 8
+
+    # cgroup v2 takes precedence
+    v2.write_text("300000 100000\n")
+    assert main._available_cpus() == 3
+    v2.write_text("max 100000\n")
+    assert main._available_cpus() == 8
+
+
+def test_jpeg_size_from_header():
+    """Test JPEG dimensions are read from the SOF segment."""
+    from main import _jpeg_size
+
+    for kwargs in ({}, {"progressive": True}):
+        img_bytes = io.BytesIO()
+        Image.new("RGB", (640, 480)).save(img_bytes, format="JPEG", **kwargs)
+        assert _jpeg_size(bytearray(img_bytes.getvalue())) == (640, 480)
+
+    assert _jpeg_size(b"\xff\xd8\xff\xe0") is None
+
+
 def test_preprocess_image_invalid():
     """Test preprocessing with invalid image data."""
     with pytest.raises(ValueError):